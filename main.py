@@ -1,15 +1,21 @@
 import io
 import os
+import asyncio
+import hashlib
 import re
 import time
 import json
+import marshal
+import functools
+import gc
 import threading
+import multiprocessing
 from uuid import uuid4
-from collections import OrderedDict
-from typing import List, Tuple, Dict, Optional, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Optional, Any, NamedTuple
 
 import fitz  # PyMuPDF
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.responses import Response, HTMLResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 
@@ -18,10 +24,33 @@ try:
 except Exception:
     openpyxl = None
 
+try:
+    import xlsxwriter
+except Exception:
+    xlsxwriter = None
+
+try:
+    from python_calamine import CalamineWorkbook
+except Exception:
+    CalamineWorkbook = None
+
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+# orjson кодирует JSON заметно быстрее stdlib json; без него — обычный JSONResponse
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except Exception:
+    from fastapi.responses import JSONResponse as DefaultJSONResponse
+
 
 app = FastAPI(
     title="Бауцентр • PDF → XLSX (АРТИКУЛ / ШТУК / ПЛОЩАДЬ)",
     version="1.0.4",
+    default_response_class=DefaultJSONResponse,
 )
 
 # Static files (logo etc.)
@@ -34,15 +63,14 @@ RX_SIZE = re.compile(r"\b\d{2,}[xх×]\d{2,}(?:[xх×]\d{1,})?\b", re.IGNORECASE
 RX_MM = re.compile(r"мм", re.IGNORECASE)
 RX_WEIGHT = re.compile(r"\b\d+(?:[.,]\d+)?\s*кг\.?\b", re.IGNORECASE)
 
-RX_MONEY_LINE = re.compile(r"^\d+(?:[ \u00a0]\d{3})*(?:[.,]\d+)?\s*₽$")
-RX_INT = re.compile(r"^\d+$")
-RX_ANY_RUB = re.compile(r"₽")
+# re.ASCII: \d/\s — однобайтовые классы; строки к этому моменту уже без NBSP
+RX_MONEY_LINE = re.compile(r"^\d+(?:[ \u00a0]\d{3})*(?:[.,]\d+)?\s*₽$", re.ASCII)
 
 RX_PRICE_QTY_SUM = re.compile(
     r"(?P<price>\d+(?:[ \u00a0]\d{3})*(?:[.,]\d+)?)\s*₽\s+"
     r"(?P<qty>\d{1,4})\s+"
     r"(?P<sum>\d+(?:[ \u00a0]\d{3})*(?:[.,]\d+)?)\s*₽",
-    re.IGNORECASE,
+    re.ASCII,
 )
 
 RX_DIMS_ANYWHERE = re.compile(
@@ -58,18 +86,29 @@ RX_AREA = re.compile(
 
 RX_FLOAT_ONLY = re.compile(r"^\d+(?:[.,]\d+)?$")
 
+# ID позиции где-то на странице (быстрая проверка, есть ли на ней таблица)
+RX_LONG_ID = re.compile(r"\b\d{6,}\b")
+
+# Служебные префиксы перед названием: "Фото", затем "Товар" (каждый не больше одного раза)
+RX_NAME_PREFIX = re.compile(r"^(?:Фото\s*)?(?:Товар\s*)?", re.IGNORECASE)
+
 
 def normalize_space(s: str) -> str:
-    s = (s or "").replace("\u00a0", " ")
-    s = re.sub(r"\s+", " ", s)
-    return s.strip()
+    # str.split() без аргументов режет по любым пробельным символам (включая NBSP),
+    # как и \s+, но без захода в regex-движок
+    return " ".join(s.split()) if s else ""
 
 
+_DIM_TRANS = str.maketrans({"×": "x", "х": "x"})
+
+
+# Чистая функция; одни и те же названия повторяются между страницами и запросами
+@functools.lru_cache(maxsize=8192)
 def normalize_key(name: str) -> str:
-    s = normalize_space(name).lower()
-    s = s.replace("×", "x").replace("х", "x")
-    s = RX_DIMS_ANYWHERE.sub(" ", s)
-    s = normalize_space(s)
+    s = normalize_space(name).lower().translate(_DIM_TRANS)
+    # Габариты всегда с "мм" — без него regex заведомо ничего не найдёт
+    if "мм" in s:
+        s = normalize_space(RX_DIMS_ANYWHERE.sub(" ", s))
     return s
 
 
@@ -84,16 +123,56 @@ def strip_dims_anywhere(name: str) -> str:
 # ENV:
 #   ART_XLSX_PATH=/path/Art1.xlsx
 #   ART_VALUE_COLUMN=BAU  (или "Артикул")
+# Разобранный справочник кэшируется рядом с xlsx (<путь>.cache.marshal) и
+# переиспользуется, пока у xlsx не изменились mtime/размер. marshal вместо pickle:
+# в кэше только dict/tuple/str/int, а их marshal читает заметно быстрее.
 # -------------------------
-def load_article_map() -> Tuple[Dict[str, str], str]:
+ARTICLE_CACHE_VERSION = 2
+# Подряд пустых строк, после которых считаем справочник законченным: max_row в xlsx
+# часто раздут форматированием пустых строк
+ARTICLE_BLANK_ROWS_STOP = 50
+
+
+def _article_cache_key(path: str, art_value_col_name: str) -> Tuple[Any, ...]:
+    st = os.stat(path)
+    return (ARTICLE_CACHE_VERSION, st.st_mtime_ns, st.st_size, art_value_col_name)
+
+
+def _read_article_cache(cache_path: str, key: Tuple[Any, ...]) -> Optional[Tuple[Dict[str, str], Dict[str, str]]]:
+    try:
+        with open(cache_path, "rb") as f:
+            data = marshal.load(f)
+        if data.get("key") == key:
+            return data["map"], data["exact"]
+    except Exception:
+        pass
+    return None
+
+
+def _write_article_cache(cache_path: str, key: Tuple[Any, ...], m: Dict[str, str], exact: Dict[str, str]) -> None:
+    # Кэш — только ускорение: если писать некуда (read-only FS), молча пропускаем
+    try:
+        # pid в имени: воркеры gunicorn и spawn-процессы парсинга пишут кэш одновременно
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            marshal.dump({"key": key, "map": m, "exact": exact}, f)
+        os.replace(tmp, cache_path)
+    except Exception:
+        pass
+
+
+def load_article_map() -> Tuple[Dict[str, str], Dict[str, str], str]:
     """Загружает соответствие 'Товар' -> 'Артикул' из Art1.xlsx.
 
+    Возвращает два индекса: по normalize_key(товар) и по точному названию без габаритов
+    (в нижнем регистре) — точное совпадение проверяется первым.
+
     Важно: в файле часто встречается Артикул = 0 — это валидное значение, его НЕ пропускаем.
     Путь можно задать через ENV ART_XLSX_PATH. Если указан относительный путь, пробуем
     также рядом с main.py и в текущей папке запуска.
     """
-    if openpyxl is None:
-        return {}, "openpyxl_not_installed"
+    if CalamineWorkbook is None and openpyxl is None:
+        return {}, {}, "openpyxl_not_installed"
 
     env_path = os.getenv("ART_XLSX_PATH", "Art1.xlsx")
     art_value_col_name = normalize_space(os.getenv("ART_VALUE_COLUMN", "Артикул"))
@@ -113,15 +192,37 @@ def load_article_map() -> Tuple[Dict[str, str], str]:
 
     path = next((p for p in candidates if p and os.path.exists(p)), None)
     if not path:
-        return {}, f"file_not_found:{env_path}"
+        return {}, {}, f"file_not_found:{env_path}"
 
+    cache_path = path + ".cache.marshal"
+    try:
+        cache_key = _article_cache_key(path, art_value_col_name)
+    except Exception:
+        cache_key = None
+    if cache_key is not None:
+        cached = _read_article_cache(cache_path, cache_key)
+        if cached is not None:
+            return cached[0], cached[1], "ok"
+
+    wb = None
+    calamine_rows = None
     try:
-        wb = openpyxl.load_workbook(path, data_only=True)
-        ws = wb[wb.sheetnames[0]]
+        if CalamineWorkbook is not None:
+            # calamine (Rust) читает xlsx в разы быстрее openpyxl; пустые ячейки отдаёт как "".
+            # skip_empty_area=False: строки и колонки считаются от A1, как в openpyxl
+            # (iter_rows() начинал бы с первой заполненной ячейки)
+            sheet = CalamineWorkbook.from_path(path).get_sheet_by_index(0)
+            calamine_rows = iter(sheet.to_python(skip_empty_area=False))
+            header_row = next(calamine_rows, [])
+        else:
+            # read_only: потоковое чтение без построения Cell-объектов на каждую ячейку
+            wb = openpyxl.load_workbook(path, data_only=True, read_only=True)
+            ws = wb[wb.sheetnames[0]]
+            header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
     except Exception as e:
-        return {}, f"cannot_open:{e}"
+        return {}, {}, f"cannot_open:{e}"
 
-    header = [normalize_space(ws.cell(1, c).value or "") for c in range(1, ws.max_column + 1)]
+    header = [normalize_space(str(v)) if v is not None else "" for v in header_row]
 
     товар_col = None
     art_col = None
@@ -142,7 +243,7 @@ def load_article_map() -> Tuple[Dict[str, str], str]:
                 break
 
     if art_col is None:
-        art_col = 2 if ws.max_column >= 2 else 1
+        art_col = 2 if len(header) >= 2 else 1
 
     def art_to_str(val: Any) -> str:
         if val is None:
@@ -161,12 +262,25 @@ def load_article_map() -> Tuple[Dict[str, str], str]:
         return s
 
     m: Dict[str, str] = {}
-    for r in range(2, ws.max_row + 1):
-        товар = ws.cell(r, товар_col).value
-        арт = ws.cell(r, art_col).value
-
-        if товар is None:
+    exact: Dict[str, str] = {}
+    blank_rows = 0
+    if calamine_rows is not None:
+        # to_python отдаёт прямоугольник от A1: все строки одной ширины с заголовком
+        rows = calamine_rows
+    else:
+        # Разбираем только нужные колонки; с max_col строки дополняются None до этой ширины
+        rows = ws.iter_rows(min_row=2, max_col=max(товар_col, art_col), values_only=True)
+    for row in rows:
+        товар = row[товар_col - 1]
+        арт = row[art_col - 1]
+
+        if товар is None or товар == "":
+            if арт is None or арт == "":
+                blank_rows += 1
+                if blank_rows >= ARTICLE_BLANK_ROWS_STOP:
+                    break
             continue
+        blank_rows = 0
 
         товар_s = normalize_space(str(товар))
         арт_s = art_to_str(арт)
@@ -176,11 +290,21 @@ def load_article_map() -> Tuple[Dict[str, str], str]:
             continue
 
         m[normalize_key(товар_s)] = арт_s
+        exact[strip_dims_anywhere(товар_s).lower()] = арт_s
 
-    return m, "ok"
+    if wb is not None:
+        wb.close()
+    if cache_key is not None:
+        _write_article_cache(cache_path, cache_key, m, exact)
+    return m, exact, "ok"
 
 
-ARTICLE_MAP, ARTICLE_MAP_STATUS = load_article_map()
+ARTICLE_MAP, ARTICLE_EXACT, ARTICLE_MAP_STATUS = load_article_map()
+# Сначала собираем мусор, оставшийся от импорта и загрузки xlsx: после freeze он уже
+# не освободится. Выигрыш от freeze — только при запуске с fork после импорта
+# (gunicorn --preload): GC в воркерах не трогает общие с мастером страницы.
+gc.collect()
+gc.freeze()
 
 # -------------------------
 # Счетчик конвертаций
@@ -191,29 +315,42 @@ COUNTER_FILE = os.getenv("COUNTER_FILE", "conversions.count")
 _counter_lock = Lock()
 
 
+def _parse_counter(raw: bytes) -> int:
+    try:
+        return int(raw.strip() or b"0")
+    except ValueError:
+        return 0
+
+
 def _read_counter() -> int:
     try:
-        with open(COUNTER_FILE, "r", encoding="utf-8") as f:
-            return int((f.read() or "0").strip())
-    except Exception:
+        with open(COUNTER_FILE, "rb") as f:
+            return _parse_counter(f.read())
+    except OSError:
         return 0
 
 
 def _write_counter(v: int) -> None:
-    tmp = COUNTER_FILE + ".tmp"
+    # tmp + os.replace: при сбое посреди записи старое значение остаётся целым
+    tmp = f"{COUNTER_FILE}.{os.getpid()}.tmp"
     with open(tmp, "w", encoding="utf-8") as f:
         f.write(str(v))
     os.replace(tmp, COUNTER_FILE)
 
 
 def increment_counter() -> int:
-    with _counter_lock:
+    # flock на отдельном .lock-файле сериализует воркеры разных процессов;
+    # _counter_lock — для потоков одного процесса (и платформ без fcntl)
+    with _counter_lock, open(COUNTER_FILE + ".lock", "a+b") as lock_f:
+        if fcntl is not None:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
         v = _read_counter() + 1
         _write_counter(v)
         return v
 
 
 def get_counter() -> int:
+    # os.replace атомарен, поэтому читатель всегда видит целый файл и без блокировки
     return _read_counter()
 
 
@@ -309,19 +446,27 @@ INSTRUCTION_VIDEO_PATH = os.getenv("INSTRUCTION_VIDEO_PATH", "instruction.mp4")
 # -------------------------
 # PDF parsing helpers
 # -------------------------
-def is_noise(line: str) -> bool:
-    low = (line or "").strip().lower()
+_NOISE_PREFIXES = ("страница:", "ваш проект")
+_NOISE_SUBSTRINGS = ("проект создан", "развертка стены", "стоимость проекта")
+_TOTALS_PREFIXES = ("общий вес", "максимальный габарит заказа", "адрес:", "телефон:", "email")
+_HEADER_TOKENS = frozenset({"id", "фото", "товар", "габариты", "вес", "цена за шт", "кол-во", "сумма", "площадь"})
+
+
+# Тип строки страницы — считаем один раз за итерацию (classify_line)
+LINE_NORMAL = 0
+LINE_NOISE = 1
+LINE_HEADER = 2
+LINE_TOTALS = 3
+
+
+# Хелперы ниже принимают low — строку, уже нормализованную (normalize_space) и
+# приведённую к нижнему регистру один раз при чтении страницы.
+def is_noise(low: str) -> bool:
     if not low:
         return True
-    if low.startswith("страница:"):
-        return True
-    if low.startswith("ваш проект"):
-        return True
-    if "проект создан" in low:
+    if low.startswith(_NOISE_PREFIXES):
         return True
-    if "развертка стены" in low:
-        return True
-    if "стоимость проекта" in low:
+    if any(x in low for x in _NOISE_SUBSTRINGS):
         return True
     # Заголовок таблицы из PDF: "ID Фото Товар Габариты Вес Цена за штук Кол-во Сумма"
     if low.startswith("id ") and "фото" in low and "товар" in low and "сумма" in low:
@@ -329,41 +474,28 @@ def is_noise(line: str) -> bool:
     return False
 
 
-def is_totals_block(line: str) -> bool:
-    low = (line or "").strip().lower()
-    return (
-        low.startswith("общий вес")
-        or low.startswith("максимальный габарит заказа")
-        or low.startswith("адрес:")
-        or low.startswith("телефон:")
-        or low.startswith("email")
-    )
+def is_totals_block(low: str) -> bool:
+    return low.startswith(_TOTALS_PREFIXES)
 
 
-def money_to_number(line: str) -> int:
-    s = normalize_space(line).replace("₽", "").strip()
-    s = s.replace("\u00a0", " ")
-    s = s.replace(" ", "")
-    s = s.replace(",", ".")
-    try:
-        return int(float(s))
-    except Exception:
-        return -1
+def is_header_token(low: str) -> bool:
+    return low.replace("–", "-").replace("—", "-") in _HEADER_TOKENS
 
 
-def is_project_total_only(line: str, prev_line: str = "") -> bool:
-    if not RX_MONEY_LINE.fullmatch(normalize_space(line)):
-        return False
-    prev = normalize_space(prev_line).lower()
-    if "стоимость проекта" in prev:
-        return True
-    v = money_to_number(line)
-    return v >= 10000
+def classify_line(low: str) -> int:
+    """Классифицирует строку за один проход: шум / заголовок таблицы / итоги / обычная."""
+    if is_noise(low):
+        return LINE_NOISE
+    if is_header_token(low):
+        return LINE_HEADER
+    if is_totals_block(low):
+        return LINE_TOTALS
+    return LINE_NORMAL
 
 
-def is_header_token(line: str) -> bool:
-    low = normalize_space(line).lower().replace("–", "-").replace("—", "-")
-    return low in {"id", "фото", "товар", "габариты", "вес", "цена за шт", "кол-во", "сумма", "площадь"}
+def is_money_line(line: str) -> bool:
+    # Дешёвая проверка по последнему символу отсекает почти все строки до regex
+    return line.endswith("₽") and RX_MONEY_LINE.fullmatch(line) is not None
 
 
 def looks_like_dim_or_weight(line: str) -> bool:
@@ -374,39 +506,6 @@ def looks_like_dim_or_weight(line: str) -> bool:
     return False
 
 
-def looks_like_money_or_qty(line: str) -> bool:
-    if RX_MONEY_LINE.fullmatch(line):
-        return True
-    if RX_INT.fullmatch(line):
-        return True
-    return False
-
-
-def clean_name_from_buffer(buf: List[str]) -> str:
-    filtered: List[str] = []
-    for ln in buf:
-        if is_noise(ln) or is_header_token(ln) or is_totals_block(ln):
-            continue
-        filtered.append(ln)
-
-    # Убираем строки, которые содержат только числовой ID (встречается как отдельная строка "0")
-    filtered = [ln for ln in filtered if not RX_INT.fullmatch(ln)]
-
-    # Если первая строка начинается с ID + пробел + текст, убираем этот ID:
-    # "670000078 Рельс несущий" -> "Рельс несущий"
-    if filtered:
-        filtered[0] = re.sub(r"^\d{3,}\s+", "", filtered[0]).strip()
-
-    while filtered and (looks_like_dim_or_weight(filtered[-1]) or looks_like_money_or_qty(filtered[-1])):
-        filtered.pop()
-
-    name = normalize_space(" ".join(filtered))
-    name = re.sub(r"^Фото\s*", "", name, flags=re.IGNORECASE).strip()
-    name = re.sub(r"^Товар\s*", "", name, flags=re.IGNORECASE).strip()
-    name = strip_dims_anywhere(name)
-    return name
-
-
 def _to_float(s: str) -> float:
     s = normalize_space(s).replace(",", ".")
     try:
@@ -439,160 +538,227 @@ def extract_area_from_context(lines: List[str]) -> float:
 # Main parser: name -> (qty_sum, area_sum)
 # -------------------------
 
-def parse_items(pdf_bytes: bytes) -> Tuple[List[Tuple[str, int, float]], Dict[str, Any]]:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    total_pages = doc.page_count
+# Найденная позиция: (name, qty, area, anchor_kind)
+PageItem = Tuple[str, int, float, str]
+
+# Параллельный разбор страниц (ENV PARSE_WORKERS, по умолчанию выключен).
+# Пул процессов поднимается лениво и живёт до конца процесса; в него уходят
+# только строки текста — fitz-объекты между процессами не передаются.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+PARSE_PARALLEL_MIN_PAGES = int(os.getenv("PARSE_PARALLEL_MIN_PAGES", "4"))
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn: fork из процесса с потоками (extract_async) небезопасен
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _parse_pool
 
-    ordered: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
 
-    stats = {
-        "pages": 0,
-        "total_pages": total_pages,
-        "processed_pages": 0,
-        "items_found": 0,
-        "anchors_inline": 0,
-        "anchors_multiline": 0,
-        "article_map_size": len(ARTICLE_MAP),
-        "article_map_status": ARTICLE_MAP_STATUS,
-        "parser": "id_segment_v3",
-    }
+class LineDesc(NamedTuple):
+    """Строка страницы с результатами всех проверок — считаются один раз при чтении."""
+    text: str  # нормализованная строка
+    low: str  # text.lower()
+    kind: int  # LINE_NORMAL / LINE_NOISE / LINE_HEADER / LINE_TOTALS
+    is_int: bool
+    is_money: bool
 
-    def flush_segment(seg_lines: List[str]) -> None:
-        if not seg_lines:
-            return
 
-        raw = [normalize_space(x) for x in seg_lines if normalize_space(x)]
-        if not raw:
-            return
+def _describe_lines(txt: str) -> List[LineDesc]:
+    descs: List[LineDesc] = []
+    for raw in txt.splitlines():
+        line = normalize_space(raw)
+        if not line:
+            continue
+        low = line.lower()
+        descs.append(LineDesc(line, low, classify_line(low), line.isdecimal(), is_money_line(line)))
+    return descs
 
-        # Первая строка сегмента почти всегда содержит ID
-        if not RX_INT.fullmatch(raw[0]):
-            return
 
-        work = raw[1:]
+def _parse_segment(seg: List[LineDesc]) -> Optional[PageItem]:
+    if not seg:
+        return None
 
-        # Отрезаем служебный хвост, если он внезапно попал в сегмент
-        cut_idx = None
-        for idx, ln in enumerate(work):
-            if is_totals_block(ln) or is_noise(ln):
-                cut_idx = idx
-                break
-        if cut_idx is not None:
-            work = work[:cut_idx]
+    # Первая строка сегмента почти всегда содержит ID
+    if not seg[0].is_int:
+        return None
 
-        if not work:
-            return
+    descs = seg[1:]
 
-        qty = 0
-        anchor_kind = None
+    # Отрезаем служебный хвост, если он внезапно попал в сегмент
+    for idx, d in enumerate(descs):
+        if d.kind == LINE_TOTALS or d.kind == LINE_NOISE:
+            descs = descs[:idx]
+            break
 
-        joined = " ".join(work)
-        m_inline = RX_PRICE_QTY_SUM.search(joined)
-        if m_inline:
-            try:
-                qty = int(m_inline.group("qty"))
-            except Exception:
-                qty = 0
-            anchor_kind = "inline"
-
-        if not (1 <= qty <= 500):
-            for i, ln in enumerate(work):
-                if RX_MONEY_LINE.fullmatch(ln):
-                    if i + 2 < len(work) and RX_INT.fullmatch(work[i + 1]) and RX_MONEY_LINE.fullmatch(work[i + 2]):
-                        try:
-                            qty = int(work[i + 1])
-                        except Exception:
-                            qty = 0
-                        anchor_kind = "multiline"
-                        break
-
-        if not (1 <= qty <= 500):
-            return
-
-        # Название = строки до первой строки с габаритами/весом/ценой
-        name_lines: List[str] = []
-        for ln in work:
-            if looks_like_dim_or_weight(ln) or RX_MONEY_LINE.fullmatch(ln):
-                break
-            if RX_INT.fullmatch(ln):
-                continue
-            if is_header_token(ln) or is_noise(ln) or is_totals_block(ln):
-                continue
-            name_lines.append(ln)
+    if not descs:
+        return None
 
-        name = strip_dims_anywhere(normalize_space(" ".join(name_lines)))
-        name = re.sub(r"^Фото\s*", "", name, flags=re.IGNORECASE).strip()
-        name = re.sub(r"^Товар\s*", "", name, flags=re.IGNORECASE).strip()
+    work = [d.text for d in descs]
 
-        if not name:
-            return
+    qty = 0
+    anchor_kind = "multiline"
 
-        area = extract_area_from_context(work)
+    joined = " ".join(work)
+    m_inline = RX_PRICE_QTY_SUM.search(joined)
+    if m_inline:
+        try:
+            qty = int(m_inline.group("qty"))
+        except Exception:
+            qty = 0
+        anchor_kind = "inline"
+
+    if not (1 <= qty <= 500):
+        for i, d in enumerate(descs):
+            if d.is_money:
+                if i + 2 < len(descs) and descs[i + 1].is_int and descs[i + 2].is_money:
+                    try:
+                        qty = int(work[i + 1])
+                    except Exception:
+                        qty = 0
+                    anchor_kind = "multiline"
+                    break
+
+    if not (1 <= qty <= 500):
+        return None
 
-        if name not in ordered:
-            ordered[name] = {"qty": 0, "area": 0.0}
-        ordered[name]["qty"] += qty
-        ordered[name]["area"] += float(area or 0.0)
-        stats["items_found"] += 1
-        if anchor_kind == "inline":
-            stats["anchors_inline"] += 1
-        else:
-            stats["anchors_multiline"] += 1
+    # Название = строки до первой строки с габаритами/весом/ценой
+    name_lines: List[str] = []
+    for d in descs:
+        if d.is_money or looks_like_dim_or_weight(d.text):
+            break
+        if d.is_int:
+            continue
+        if d.kind != LINE_NORMAL:
+            continue
+        name_lines.append(d.text)
 
-    for page in doc:
-        stats["pages"] += 1
-        stats["processed_pages"] += 1
+    # Строки уже нормализованы: склейка через " " нормализации не требует,
+    # после вырезания габаритов пробелы схлопываем один раз
+    name = " ".join(RX_DIMS_ANYWHERE.sub(" ", " ".join(name_lines)).split())
+    name = RX_NAME_PREFIX.sub("", name, count=1)
 
-        txt = page.get_text("text") or ""
-        if "₽" not in txt and "ID" not in txt and not re.search(r"\b\d{6,}\b", txt):
-            continue
+    if not name:
+        return None
 
-        lines = [normalize_space(x) for x in txt.splitlines()]
-        lines = [x for x in lines if x]
-        if not lines:
-            continue
+    area = extract_area_from_context(work)
+    return name, qty, float(area or 0.0), anchor_kind
 
-        segment: List[str] = []
-        in_table = False
 
-        for idx, line in enumerate(lines):
-            prev = lines[idx - 1] if idx > 0 else ""
+def _parse_page_text(txt: str) -> List[PageItem]:
+    """Разбирает текст одной страницы. Состояние таблицы — только в пределах страницы."""
+    items: List[PageItem] = []
 
-            if is_noise(line) or is_header_token(line):
-                # Заголовок таблицы может быть без отдельной строки с "ID Фото..."
-                if "id" in line.lower() and "товар" in line.lower():
-                    in_table = True
-                continue
+    def flush_segment(seg: List[LineDesc]) -> None:
+        item = _parse_segment(seg)
+        if item is not None:
+            items.append(item)
+
+    segment: List[LineDesc] = []
+    in_table = False
 
-            # Начало новой позиции по ID
-            if RX_INT.fullmatch(line) and (len(line) >= 6 or line == '0'):
+    # Все проверки строки (нормализация, lower, тип, число/сумма) — один раз в _describe_lines
+    for d in _describe_lines(txt):
+        kind = d.kind
+
+        if kind == LINE_NOISE or kind == LINE_HEADER:
+            # Заголовок таблицы может быть без отдельной строки с "ID Фото..."
+            if "id" in d.low and "товар" in d.low:
                 in_table = True
-                if segment:
-                    flush_segment(segment)
-                segment = [line]
-                continue
+            continue
 
-            if not in_table:
-                continue
+        # Начало новой позиции по ID
+        if d.is_int and (len(d.text) >= 6 or d.text == '0'):
+            in_table = True
+            if segment:
+                flush_segment(segment)
+            segment = [d]
+            continue
 
-            # После блока итогов позиции заканчиваются. Саму сумму проекта здесь не ловим,
-            # иначе можно ошибочно оборвать строку с большой суммой по позиции.
-            if is_totals_block(line):
-                if segment:
-                    flush_segment(segment)
-                    segment = []
-                in_table = False
-                continue
+        if not in_table:
+            continue
 
+        # После блока итогов позиции заканчиваются. Саму сумму проекта здесь не ловим,
+        # иначе можно ошибочно оборвать строку с большой суммой по позиции.
+        # Страницу не обрываем: "адрес:"/"телефон:" встречаются и посреди таблицы,
+        # следующая строка с ID снова откроет позицию.
+        if kind == LINE_TOTALS:
             if segment:
-                segment.append(line)
+                flush_segment(segment)
+                segment = []
+            in_table = False
+            continue
 
         if segment:
-            flush_segment(segment)
+            segment.append(d)
+
+    if segment:
+        flush_segment(segment)
+
+    return items
+
 
-    out_rows: List[Tuple[str, int, float]] = []
-    for name, v in ordered.items():
-        out_rows.append((name, int(v.get("qty") or 0), float(v.get("area") or 0.0)))
+def parse_items(pdf_bytes: bytes) -> Tuple[List[Tuple[str, int, float]], Dict[str, Any]]:
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    total_pages = doc.page_count
+
+    # name -> [qty, area]; dict сохраняет порядок вставки
+    ordered: Dict[str, List[Any]] = {}
+
+    # Счётчики — локальные переменные, в stats записываются один раз в конце
+    pages = 0
+    items_found = 0
+    anchors_inline = 0
+
+    # Текст извлекаем в этом процессе (fitz-объекты не сериализуются), разбор — по страницам
+    texts: List[str] = []
+    for page in doc:
+        pages += 1
+
+        # page.search_for("₽") не дешевле: он строит тот же TextPage, что и get_text.
+        txt = page.get_text("text") or ""
+        if "₽" not in txt and "ID" not in txt and not RX_LONG_ID.search(txt):
+            continue
+        texts.append(txt)
+
+    if PARSE_WORKERS > 1 and len(texts) >= PARSE_PARALLEL_MIN_PAGES:
+        per_page = list(_get_parse_pool().map(_parse_page_text, texts))
+    else:
+        per_page = [_parse_page_text(txt) for txt in texts]
+
+    # Слияние в порядке страниц — порядок первых вхождений сохраняется
+    for items in per_page:
+        for name, qty, area, anchor_kind in items:
+            entry = ordered.get(name)
+            if entry is None:
+                ordered[name] = [qty, area]
+            else:
+                entry[0] += qty
+                entry[1] += area
+            items_found += 1
+            if anchor_kind == "inline":
+                anchors_inline += 1
+
+    stats = {
+        "pages": pages,
+        "total_pages": total_pages,
+        "processed_pages": pages,
+        "items_found": items_found,
+        "anchors_inline": anchors_inline,
+        "anchors_multiline": items_found - anchors_inline,
+        "article_map_size": len(ARTICLE_MAP),
+        "article_map_status": ARTICLE_MAP_STATUS,
+        "parser": "id_segment_v3",
+    }
+
+    out_rows: List[Tuple[str, int, float]] = [(name, qty, area) for name, (qty, area) in ordered.items()]
 
     return out_rows, stats
 
@@ -602,7 +768,20 @@ def parse_items(pdf_bytes: bytes) -> Tuple[List[Tuple[str, int, float]], Dict[st
 # - если артикула нет в Art1.xlsx → пишем наименование товара
 # - если площадь = 0 → пустая ячейка
 # -------------------------
+def _xlsx_row(name: str, qty: int, area: float) -> Tuple[str, int, Optional[float]]:
+    art = ARTICLE_EXACT.get(name.lower()) or ARTICLE_MAP.get(normalize_key(name), "")
+    art_out = name if (not art or str(art).strip() == '0') else art  # fallback на наименование, если нет артикула или он = 0
+
+    area_cell = float(area) if area and float(area) > 0 else None  # None => пусто в Excel
+
+    return art_out, int(qty or 0), area_cell
+
+
 def make_xlsx(rows: List[Tuple[str, int, float]]) -> bytes:
+    # xlsxwriter пишет строки сразу в XML без DOM всей книги; openpyxl — запасной вариант
+    if xlsxwriter is not None:
+        return _make_xlsx_xlsxwriter(rows)
+
     if openpyxl is None:
         raise RuntimeError("openpyxl is not installed")
 
@@ -613,12 +792,7 @@ def make_xlsx(rows: List[Tuple[str, int, float]]) -> bytes:
     ws.append(["АРТИКУЛ", "ШТУК", "ПЛОЩАДЬ"])
 
     for name, qty, area in rows:
-        art = ARTICLE_MAP.get(normalize_key(name), "")
-        art_out = name if (not art or str(art).strip() == '0') else art  # fallback на наименование, если нет артикула или он = 0
-
-        area_cell = float(area) if area and float(area) > 0 else None  # None => пусто в Excel
-
-        ws.append([art_out, int(qty or 0), area_cell])
+        ws.append(list(_xlsx_row(name, qty, area)))
 
     ws.column_dimensions["A"].width = 48
     ws.column_dimensions["B"].width = 10
@@ -636,6 +810,35 @@ def make_xlsx(rows: List[Tuple[str, int, float]]) -> bytes:
     return bio.getvalue()
 
 
+def _make_xlsx_xlsxwriter(rows: List[Tuple[str, int, float]]) -> bytes:
+    bio = io.BytesIO()
+    # in_memory: книга маленькая, временные файлы не нужны
+    wb = xlsxwriter.Workbook(bio, {"in_memory": True})
+    ws = wb.add_worksheet("BAU")
+    fmt_qty = wb.add_format({"num_format": "0"})
+    fmt_area = wb.add_format({"num_format": "0.00"})
+
+    ws.write_row(0, 0, ["АРТИКУЛ", "ШТУК", "ПЛОЩАДЬ"])
+
+    for r, (name, qty, area) in enumerate(rows, start=1):
+        art_out, qty_cell, area_cell = _xlsx_row(name, qty, area)
+        ws.write_string(r, 0, art_out)
+        ws.write_number(r, 1, qty_cell, fmt_qty)
+        if area_cell is not None:
+            ws.write_number(r, 2, area_cell, fmt_area)
+        else:
+            ws.write_blank(r, 2, None, fmt_area)
+
+    ws.set_column(0, 0, 48)
+    ws.set_column(1, 1, 10)
+    ws.set_column(2, 2, 14)
+
+    ws.freeze_panes(1, 0)
+
+    wb.close()
+    return bio.getvalue()
+
+
 # -------------------------
 # UI (компактная версия)
 # -------------------------
@@ -1076,6 +1279,22 @@ HOME_HTML = """<!doctype html>
 </html>
 """
 
+# Страница статична: кодируем один раз и отдаём с ETag (304 при совпадении)
+_HOME_BYTES = HOME_HTML.encode("utf-8")
+_HOME_ETAG = '"' + hashlib.md5(_HOME_BYTES).hexdigest() + '"'
+_HOME_HEADERS = {"ETag": _HOME_ETAG, "Cache-Control": "public, max-age=3600"}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match может быть списком и/или со слабыми валидаторами: W/"...", "*"
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
 
 # -------------------------
 # Endpoints
@@ -1103,12 +1322,15 @@ def health():
         "job_dir": JOB_DIR,
         "job_files": job_files,
         "openpyxl": bool(openpyxl is not None),
+        "xlsxwriter": bool(xlsxwriter is not None),
     }
 
 
 @app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
-def home():
-    return HOME_HTML
+def home(request: Request):
+    if _etag_matches(request.headers.get("if-none-match"), _HOME_ETAG):
+        return Response(status_code=304, headers=_HOME_HEADERS)
+    return Response(content=_HOME_BYTES, media_type="text/html; charset=utf-8", headers=_HOME_HEADERS)
 
 
 @app.api_route("/instruction.mp4", methods=["GET", "HEAD"])
@@ -1118,26 +1340,43 @@ def instruction_video():
     return FileResponse(INSTRUCTION_VIDEO_PATH, media_type="video/mp4")
 
 
+# Сколько PDF одновременно разбирается в потоках (/extract и задачи /extract_async вместе).
+# PyMuPDF не потокобезопасен, поэтому по умолчанию 1: разборы идут по очереди.
+EXTRACT_MAX_INFLIGHT = max(1, int(os.getenv("EXTRACT_MAX_INFLIGHT", "1")))
+_parse_slots = threading.BoundedSemaphore(EXTRACT_MAX_INFLIGHT)
+# /extract ждёт очереди в event loop, а не в занятом потоке пула to_thread
+_extract_sem = asyncio.Semaphore(EXTRACT_MAX_INFLIGHT)
+
+
+def _parse_items_limited(pdf_bytes: bytes) -> Tuple[List[Tuple[str, int, float]], Dict[str, Any]]:
+    with _parse_slots:
+        return parse_items(pdf_bytes)
+
+
 @app.post("/extract")
 async def extract(file: UploadFile = File(...)):
     if not (file.filename or "").lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Загрузите PDF файл (.pdf).")
 
-    if openpyxl is None:
-        raise HTTPException(status_code=500, detail="openpyxl не установлен (нужен для XLSX).")
+    if xlsxwriter is None and openpyxl is None:
+        raise HTTPException(status_code=500, detail="xlsxwriter/openpyxl не установлены (нужны для XLSX).")
 
     pdf_bytes = await file.read()
 
-    try:
-        rows, stats_ = parse_items(pdf_bytes)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Не удалось распарсить PDF: {e}")
+    # Разбор и сборка XLSX — чистый CPU; выносим в поток, чтобы не блокировать event loop
+    async with _extract_sem:
+        try:
+            rows, stats_ = await asyncio.to_thread(_parse_items_limited, pdf_bytes)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Не удалось распарсить PDF: {e}")
 
-    if not rows:
-        raise HTTPException(status_code=422, detail=f"Не удалось найти позиции. debug={stats_}")
+        if not rows:
+            raise HTTPException(status_code=422, detail=f"Не удалось найти позиции. debug={stats_}")
 
-    xlsx_bytes = make_xlsx(rows)
-    increment_counter()
+        xlsx_bytes = await asyncio.to_thread(make_xlsx, rows)
+
+    # Запись счётчика — файловый I/O; не блокируем event loop
+    await asyncio.to_thread(increment_counter)
     return Response(
         content=xlsx_bytes,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
@@ -1150,8 +1389,8 @@ async def extract_async(file: UploadFile = File(...)):
     if not (file.filename or "").lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Загрузите PDF файл (.pdf).")
 
-    if openpyxl is None:
-        raise HTTPException(status_code=500, detail="openpyxl не установлен (нужен для XLSX).")
+    if xlsxwriter is None and openpyxl is None:
+        raise HTTPException(status_code=500, detail="xlsxwriter/openpyxl не установлены (нужны для XLSX).")
 
     pdf_bytes = await file.read()
     original_filename = file.filename or "items.pdf"
@@ -1170,7 +1409,7 @@ async def extract_async(file: UploadFile = File(...)):
     def worker():
         try:
             _set_job(job_id, message="Читаю PDF…")
-            rows, st = parse_items(pdf_bytes)
+            rows, st = _parse_items_limited(pdf_bytes)
 
             _set_job(
                 job_id,
@@ -0,0 +1,32 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # main монтирует static/ относительно текущей папки
+
+import main  # noqa: E402
+
+HEADER = "ID Фото Товар Габариты Вес Цена за шт Кол-во Сумма"
+
+
+def test_item_after_mid_page_phone_line_is_kept():
+    txt = "\n".join([
+        HEADER,
+        "670000078", "Фото", "Рельс несущий", "1 234 ₽", "2", "2 468 ₽",
+        "Телефон: +7 900 000-00-00",
+        "670000079", "Кронштейн", "150 ₽", "4", "600 ₽",
+    ])
+    items = main._parse_page_text(txt)
+    assert [(name, qty) for name, qty, _area, _kind in items] == [("Рельс несущий", 2), ("Кронштейн", 4)]
+
+
+def test_totals_line_closes_open_segment():
+    txt = "\n".join([
+        HEADER,
+        "670000078", "Рельс несущий", "1 234 ₽", "2", "2 468 ₽",
+        "Общий вес: 12 кг",
+        "Кронштейн",
+    ])
+    items = main._parse_page_text(txt)
+    assert [(name, qty) for name, qty, _area, _kind in items] == [("Рельс несущий", 2)]